@@ -1,5 +1,13 @@
-import os, requests, telebot, time, json, threading
+import os, io, requests, telebot, time, json, threading, functools, itertools, heapq, queue
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
+from types import MappingProxyType
+from multiprocessing.managers import BaseManager
+import multiprocessing
+import zlib
+import numpy as np
 import feedparser
 from bs4 import BeautifulSoup
 from telebot import types
@@ -15,9 +23,19 @@ FINNHUB_KEY = os.getenv("FINNHUB_KEY")  # finnhub.io - 60/min
 COINGECKO_KEY = os.getenv("COINGECKO_KEY")  # coingecko.com - completely free
 FRED_KEY = os.getenv("FRED_KEY")  # fred.stlouisfed.org - completely free
 
+# Sharded mode: BOT_SHARDS=N runs 1 ingest + N worker + 1 sender processes
+SHARDS = int(os.getenv("BOT_SHARDS", "0"))
+INGEST_INTERVAL = int(os.getenv("INGEST_INTERVAL", "60"))
+
+# Seconds an interactive request waits for fresh data before serving last-known-good
+FETCH_BUDGET = float(os.getenv("FETCH_BUDGET", "2.5"))
+
 bot = telebot.TeleBot(TOKEN)
 DB_FILE = "advisor_memory.json"
-ALERT_SENT = {}
+ALERT_STATE_FILE = "alert_state.json"
+HISTORY_DIR = "price_history"
+HISTORY_LOCK = threading.Lock()
+MEM_LOCK = threading.Lock()
 
 # --- PERSISTENCE ---
 def load_mem():
@@ -29,29 +47,361 @@ def load_mem():
     except:
         return {"seen_urls": [], "last_update": None, "user_alerts": {}}
 
+def _write_json(path, data):
+    """Write-then-rename so readers (and other processes) never see a torn file"""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
 def save_mem(url=None, user_id=None, alert_data=None):
-    mem = load_mem()
+    with MEM_LOCK:
+        mem = load_mem()
+        
+        if url:
+            if "seen_urls" not in mem:
+                mem["seen_urls"] = []
+            mem["seen_urls"].append(url)
+            mem["seen_urls"] = mem["seen_urls"][-1000:]
+        
+        if user_id and alert_data:
+            if "user_alerts" not in mem:
+                mem["user_alerts"] = {}
+            mem["user_alerts"][str(user_id)] = alert_data
+        
+        mem["last_update"] = datetime.now().isoformat()
+        
+        _write_json(DB_FILE, mem)
+
+def load_alert_state():
+    try:
+        with open(ALERT_STATE_FILE, "r") as f:
+            return json.load(f)
+    except:
+        return {}
+
+def save_alert_state(state):
+    # Own file: save_mem's read-modify-write from news threads can't clobber it
+    _write_json(ALERT_STATE_FILE, state)
+
+def _history_path(key):
+    return os.path.join(HISTORY_DIR, "".join(c if c.isalnum() or c in "-." else "_" for c in key) + ".json")
+
+def load_history(key):
+    """{'fetched_at', 'bars'} for one symbol/range/interval, or None"""
+    try:
+        with open(_history_path(key), "r") as f:
+            return json.load(f)
+    except:
+        return None
+
+def save_history(key, bars, max_bars=500, fetched_at=None):
+    """Merge fresh bars into the local store, keyed by timestamp"""
+    with HISTORY_LOCK:
+        entry = load_history(key) or {'bars': []}
+        merged = {}
+        for bar in entry['bars'] + bars:
+            merged[bar[0]] = bar
+        entry = {'fetched_at': time.time() if fetched_at is None else fetched_at, 'bars': [merged[ts] for ts in sorted(merged)][-max_bars:]}
+        
+        os.makedirs(HISTORY_DIR, exist_ok=True)
+        _write_json(_history_path(key), entry)
+        return entry
+
+# ===========================================
+# SHARED CACHE
+# ===========================================
+# In sharded mode one ingest process polls upstream APIs and writes results
+# to a LocalCache served by a multiprocessing manager; workers only read it.
+# Per-request lookups (price history, news) can't be polled ahead of time,
+# so workers ask ingest for them over INGEST_REQUESTS and wait on the cache.
+
+ROLE = "single"  # single | ingest | worker | sender
+SHARED_CACHE = None
+CACHE_TTL = 15 * 60
+INGEST_REQUESTS = None
+ON_DEMAND = {}  # fetcher name -> undecorated fetcher, run by ingest
+ON_DEMAND_TIMEOUT = 15
+ON_DEMAND_TTL = 5 * 60
+
+class LocalCache:
+    """Redis-style get/set with expiry, shared by all processes on this box"""
     
-    if url:
-        if "seen_urls" not in mem:
-            mem["seen_urls"] = []
-        mem["seen_urls"].append(url)
-        mem["seen_urls"] = mem["seen_urls"][-1000:]
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
     
-    if user_id and alert_data:
-        if "user_alerts" not in mem:
-            mem["user_alerts"] = {}
-        mem["user_alerts"][str(user_id)] = alert_data
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[1] is not None and item[1] < time.time():
+                del self._data[key]
+                return None
+            return item[0]
+    
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ex if ex else None)
+        return True
+    
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+    
+    def mset(self, mapping):
+        """Set several keys atomically"""
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = (value, None)
+        return True
+    
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+class CacheManager(BaseManager):
+    pass
+
+CacheManager.register('LocalCache', LocalCache)
+
+def ingest_owned(fn):
+    """Workers read the ingest process's latest result instead of polling upstream"""
+    def fetch_with_age(*args):
+        # (result, fetched at): in a worker, when ingest fetched its cached copy
+        key = f"{fn.__name__}:{','.join(map(str, args))}"
+        if ROLE == "worker":
+            return SHARED_CACHE.get(key) or (None, None)
+        
+        result, fetched = fn(*args), time.time()
+        if ROLE == "ingest" and result:
+            SHARED_CACHE.set(key, (result, fetched), ex=CACHE_TTL)
+        return result, fetched
+    
+    @functools.wraps(fn)
+    def wrapper(*args):
+        return fetch_with_age(*args)[0]
+    wrapper.fetch_with_age = fetch_with_age
+    return wrapper
+
+def _on_demand_key(name, args, kwargs):
+    return f"{name}:{','.join(map(str, args))}:{','.join(f'{k}={v}' for k, v in sorted(kwargs.items()))}"
+
+def ingest_on_demand(fn):
+    """Workers ask the ingest process to run the fetch and wait for its result"""
+    ON_DEMAND[fn.__name__] = fn
+    
+    def fetch_with_age(*args, **kwargs):
+        if ROLE != "worker":
+            return fn(*args, **kwargs), time.time()
+        
+        key = _on_demand_key(fn.__name__, args, kwargs)
+        requested = time.time()
+        INGEST_REQUESTS.put((fn.__name__, args, kwargs, key))
+        
+        deadline = time.monotonic() + ON_DEMAND_TIMEOUT
+        while time.monotonic() < deadline:
+            item = SHARED_CACHE.get(key)
+            if item and item[1] >= requested:
+                return item
+            time.sleep(0.1)
+        return None, None
     
-    mem["last_update"] = datetime.now().isoformat()
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return fetch_with_age(*args, **kwargs)[0]
+    wrapper.fetch_with_age = fetch_with_age
+    return wrapper
+
+def serve_on_demand(requests_queue):
+    """Ingest side of ingest_on_demand: one upstream call per key at a time"""
+    pool = ThreadPoolExecutor(max_workers=4)
+    in_flight = set()
+    lock = threading.Lock()
+    
+    def fetch(name, args, kwargs, key):
+        try:
+            result = ON_DEMAND[name](*args, **kwargs)
+        except Exception as e:
+            print(f"On-demand {name} error: {e}")
+            result = None
+        SHARED_CACHE.set(key, (result, time.time()), ex=ON_DEMAND_TTL)
+        with lock:
+            in_flight.discard(key)
+    
+    while True:
+        name, args, kwargs, key = requests_queue.get()
+        with lock:
+            # A fetch already running finishes after this request was made,
+            # so its result satisfies this waiter too
+            if key in in_flight:
+                continue
+            in_flight.add(key)
+        pool.submit(fetch, name, args, kwargs, key)
+
+# ===========================================
+# MARKET STATE
+# ===========================================
+# Fetchers publish normalised Quote records here; readers take one snapshot
+# and render from it, so a message always shows a single point in time.
+
+GLOBAL_SYMBOLS = {'^DJI': 'DOW JONES', '^GSPC': 'S&P 500', '^IXIC': 'NASDAQ', '^N225': 'NIKKEI'}
+COMMODITY_SYMBOLS = {'GC=F': 'GOLD', 'SI=F': 'SILVER', 'CL=F': 'CRUDE_OIL', 'HG=F': 'COPPER', 'NG=F': 'NATURAL_GAS'}
+CRYPTO_NAMES = {'bitcoin': 'BTC', 'ethereum': 'ETH', 'binancecoin': 'BNB', 'ripple': 'XRP', 'cardano': 'ADA'}
+
+class Quote(namedtuple('Quote', 'symbol name group price change change_pct open alt_price ts')):
+    """One instrument at one point in time - a tuple, so it can't change once published"""
+    __slots__ = ()
+    
+    def __new__(cls, symbol, name, group, price, change=0.0, change_pct=0.0, open=None, alt_price=None, ts=None):
+        return super().__new__(cls, symbol, name, group, price, change, change_pct, open, alt_price, ts or time.time())
+
+# Quotes live in fixed buckets so a publish copies (and mirrors) only the
+# buckets it touches, not every symbol
+QUOTE_BUCKETS = 128
+
+def _bucket(symbol):
+    return zlib.crc32(symbol.encode()) % QUOTE_BUCKETS
+
+class MarketSnapshot:
+    """Immutable, versioned view of every published quote"""
+    __slots__ = ('version', 'ts', 'buckets', 'bucket_versions', 'groups', 'groups_version')
+    
+    def __init__(self, version, ts, buckets, bucket_versions, groups, groups_version):
+        for name, value in (('version', version), ('ts', ts), ('buckets', tuple(MappingProxyType(b) for b in buckets)),
+                            ('bucket_versions', tuple(bucket_versions)), ('groups', MappingProxyType(groups)),
+                            ('groups_version', groups_version)):
+            object.__setattr__(self, name, value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("MarketSnapshot is immutable")
+    
+    def __reduce__(self):
+        return (MarketSnapshot, (self.version, self.ts, [dict(b) for b in self.buckets],
+                                 self.bucket_versions, dict(self.groups), self.groups_version))
+    
+    def __len__(self):
+        return sum(len(b) for b in self.buckets)
+    
+    def get(self, symbol):
+        return self.buckets[_bucket(symbol)].get(symbol)
+    
+    def group(self, name):
+        """Quotes of one group, in first-published order"""
+        quotes = (self.get(symbol) for symbol in self.groups.get(name, ()))
+        return [quote for quote in quotes if quote is not None]
+
+class MarketState:
+    """Copy-on-write quote store: writers serialise, readers never lock"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = MarketSnapshot(0, None, [{}] * QUOTE_BUCKETS, [0] * QUOTE_BUCKETS, {}, 0)
+        self._cache = None
+        self._writer = False
+    
+    def attach(self, cache, writer):
+        """Mirror snapshots through the shared cache (writer) or follow them (reader)"""
+        self._cache, self._writer = cache, writer
+    
+    def snapshot(self):
+        if self._cache is not None and not self._writer:
+            self._follow()
+        return self._snapshot
+    
+    def _follow(self):
+        # One small round trip when nothing changed; otherwise pull only the
+        # buckets whose version moved
+        for _ in range(3):
+            index = self._cache.get('market_state:index')
+            old = self._snapshot
+            if not index or index[0] == old.version:
+                return
+            
+            version, ts, bucket_versions, groups_version = index
+            stale = [i for i, v in enumerate(bucket_versions) if v != old.bucket_versions[i]]
+            keys = [f"market_state:bucket:{i}" for i in stale]
+            if groups_version != old.groups_version:
+                keys.append('market_state:groups')
+            values = self._cache.mget(keys)
+            
+            buckets, versions = list(old.buckets), list(old.bucket_versions)
+            for i, item in zip(stale, values):
+                versions[i], buckets[i] = item
+            fetched_groups_version, groups = old.groups_version, old.groups
+            if groups_version != old.groups_version:
+                fetched_groups_version, groups = values[len(stale)]
+            
+            # A publish landed between the two reads: retry for a consistent view
+            if max(versions) > version or fetched_groups_version != groups_version:
+                continue
+            self._snapshot = MarketSnapshot(version, ts, buckets, versions, groups, groups_version)
+            return
+    
+    def publish(self, quotes):
+        """Apply a batch of quotes as one new version"""
+        if not quotes:
+            return self._snapshot
+        
+        with self._lock:
+            old = self._snapshot
+            version = old.version + 1
+            touched = {}
+            added = {}
+            
+            for quote in quotes:
+                i = _bucket(quote.symbol)
+                if i not in touched:
+                    touched[i] = dict(old.buckets[i])
+                if quote.symbol not in touched[i]:
+                    added.setdefault(quote.group, []).append(quote.symbol)
+                touched[i][quote.symbol] = quote
+            
+            buckets, versions = list(old.buckets), list(old.bucket_versions)
+            for i, bucket in touched.items():
+                buckets[i], versions[i] = bucket, version
+            
+            groups, groups_version = old.groups, old.groups_version
+            if added:
+                groups = dict(groups)
+                for group, symbols in added.items():
+                    groups[group] = groups.get(group, ()) + tuple(symbols)
+                groups_version = version
+            
+            self._snapshot = MarketSnapshot(version, time.time(), buckets, versions, groups, groups_version)
+            
+            if self._cache is not None and self._writer:
+                mirror = {f"market_state:bucket:{i}": (version, bucket) for i, bucket in touched.items()}
+                if added:
+                    mirror['market_state:groups'] = (groups_version, groups)
+                mirror['market_state:index'] = (version, self._snapshot.ts, versions, groups_version)
+                self._cache.mset(mirror)
+            return self._snapshot
+
+MARKET_STATE = MarketState()
+
+def format_quote(quote):
+    """Telegram line for a quote, styled per market group"""
+    emoji = "🟢" if quote.change_pct >= 0 else "🔴"
     
-    with open(DB_FILE, "w") as f:
-        json.dump(mem, f)
+    if quote.group == 'indian':
+        return f"{emoji} *{quote.name}*: ₹{quote.price:,.2f} ({quote.change_pct:+.2f}%)"
+    if quote.group == 'crypto':
+        return f"{emoji} *{quote.name}*: ${quote.price:,.2f} (₹{quote.alt_price:,.0f}) {quote.change_pct:+.2f}%"
+    if quote.group == 'forex':
+        return f"• *{quote.name}*: ₹{quote.price:.2f}"
+    if quote.group == 'commodities':
+        return f"{emoji} *{quote.name}*: ${quote.price:,.2f} ({quote.change_pct:+.2f}%)"
+    return f"{emoji} *{quote.name}*: {quote.price:,.2f} ({quote.change_pct:+.2f}%)"
+
+def format_group(snapshot, group):
+    return "".join(format_quote(q) + "\n" for q in snapshot.group(group) if q.price > 0)
 
 # ===========================================
 # STOCK MARKET DATA
 # ===========================================
 
+@ingest_owned
 def get_nse_data():
     """NSE India - Free, official"""
     try:
@@ -63,6 +413,7 @@ def get_nse_data():
             data = response.json()
             indices = {}
             
+            quotes = []
             for index in data.get('data', []):
                 name = index.get('index', '')
                 if name in ['NIFTY 50', 'NIFTY BANK', 'NIFTY IT', 'NIFTY PHARMA']:
@@ -71,6 +422,10 @@ def get_nse_data():
                         'change': float(index.get('percentChange', 0)),
                         'open': float(index.get('open', 0))
                     }
+                    quotes.append(Quote(name, name, 'indian', indices[name]['last'],
+                                        float(index.get('variation', 0)), indices[name]['change'],
+                                        indices[name]['open']))
+            MARKET_STATE.publish(quotes)
             return indices
     except:
         pass
@@ -89,11 +444,13 @@ def get_alpha_vantage_stock(symbol):
             data = response.json()
             quote = data.get('Global Quote', {})
             
-            return {
+            result = {
                 'price': float(quote.get('05. price', 0)),
                 'change': float(quote.get('09. change', 0)),
                 'change_pct': float(quote.get('10. change percent', '0').replace('%', ''))
             }
+            MARKET_STATE.publish([Quote(symbol, symbol, 'stocks', **result)])
+            return result
     except:
         pass
     return None
@@ -113,15 +470,26 @@ def get_finnhub_stock(symbol):
             prev = data.get('pc', 0)
             
             if prev > 0:
-                return {
+                result = {
                     'price': current,
                     'change': current - prev,
                     'change_pct': ((current - prev) / prev) * 100
                 }
+                MARKET_STATE.publish([Quote(symbol, symbol, 'stocks', **result)])
+                return result
     except:
         pass
     return None
 
+def symbol_group(symbol):
+    """(display name, group) for a Yahoo symbol"""
+    if symbol in GLOBAL_SYMBOLS:
+        return GLOBAL_SYMBOLS[symbol], 'global'
+    if symbol in COMMODITY_SYMBOLS:
+        return COMMODITY_SYMBOLS[symbol], 'commodities'
+    return symbol, 'stocks'
+
+@ingest_owned
 def get_yahoo_finance_data(symbol):
     """Yahoo Finance - Free, no key needed"""
     try:
@@ -134,19 +502,75 @@ def get_yahoo_finance_data(symbol):
             prev = data.get('previousClose', current)
             
             if prev > 0:
-                return {
+                result = {
                     'price': current,
                     'change': current - prev,
                     'change_pct': ((current - prev) / prev) * 100
                 }
+                MARKET_STATE.publish([Quote(symbol, *symbol_group(symbol), **result)])
+                return result
+    except:
+        pass
+    return None
+
+@ingest_on_demand
+def get_yahoo_history(symbol, range_="1mo", interval="1d"):
+    """Yahoo Finance OHLCV bars - same chart endpoint, wider range"""
+    try:
+        url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?interval={interval}&range={range_}"
+        response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=8)
+        
+        if response.status_code == 200:
+            result = response.json()['chart']['result'][0]
+            quote = result['indicators']['quote'][0]
+            
+            bars = []
+            for i, ts in enumerate(result.get('timestamp') or []):
+                o, h, l, c = quote['open'][i], quote['high'][i], quote['low'][i], quote['close'][i]
+                if None in (o, h, l, c):
+                    continue
+                bars.append([ts, o, h, l, c, quote['volume'][i] or 0])
+            return bars
     except:
         pass
     return None
 
+# How long stored bars count as current before Yahoo is asked again
+HISTORY_MAX_AGE = {'5m': 300, '30m': 1800, '1d': 900, '1wk': 3600}
+
+def get_price_history(symbol, range_="1mo", interval="1d", span=None, budget=FETCH_BUDGET):
+    """(bars, as_of): stored bars, refreshed from Yahoo within the fetch budget once stale
+    
+    as_of is when the bars were fetched if the refresh missed the budget and
+    older stored bars are served instead, else None.
+    """
+    key = f"{symbol}|{range_}|{interval}"
+    max_age = HISTORY_MAX_AGE.get(interval, 900)
+    entry = load_history(key)
+    
+    if not entry or time.time() - entry['fetched_at'] > max_age:
+        [(bars, as_of)] = fetch_with_budget([(get_yahoo_history, (symbol, range_, interval))], budget)
+        fetched = time.time() if as_of is None else as_of
+        # A last-known-good result may be older than what is already stored
+        if bars and (not entry or fetched > entry['fetched_at']):
+            entry = save_history(key, bars, fetched_at=fetched)
+    
+    if not entry:
+        return None, None
+    
+    bars = entry['bars']
+    as_of = entry['fetched_at'] if time.time() - entry['fetched_at'] > max_age else None
+    
+    # The store keeps older bars too; trim to the requested window
+    if bars and span:
+        bars = [bar for bar in bars if bar[0] >= bars[-1][0] - span]
+    return bars, as_of
+
 # ===========================================
 # CRYPTOCURRENCY
 # ===========================================
 
+@ingest_owned
 def get_crypto_prices():
     """CoinGecko - Completely free, no key needed"""
     try:
@@ -164,6 +588,13 @@ def get_crypto_prices():
                     'change_24h': values.get('usd_24h_change', 0)
                 }
             
+            # Publish in display order rather than API response order
+            order = [c for c in CRYPTO_NAMES if c in crypto_data] + [c for c in crypto_data if c not in CRYPTO_NAMES]
+            MARKET_STATE.publish([
+                Quote(coin, CRYPTO_NAMES.get(coin, coin.upper()), 'crypto', crypto_data[coin]['usd'],
+                      change_pct=crypto_data[coin]['change_24h'] or 0, alt_price=crypto_data[coin]['inr'])
+                for coin in order
+            ])
             return crypto_data
     except:
         pass
@@ -173,6 +604,7 @@ def get_crypto_prices():
 # FOREX / CURRENCIES
 # ===========================================
 
+@ingest_owned
 def get_currency_rates():
     """ExchangeRate-API - 1500 calls/month free"""
     try:
@@ -181,12 +613,14 @@ def get_currency_rates():
         
         if response.status_code == 200:
             rates = response.json().get('rates', {})
-            return {
+            pairs = {
                 'USD/INR': rates.get('INR', 0),
                 'EUR/INR': rates.get('INR', 0) / rates.get('EUR', 1) if rates.get('EUR') else 0,
                 'GBP/INR': rates.get('INR', 0) / rates.get('GBP', 1) if rates.get('GBP') else 0,
                 'JPY/INR': rates.get('INR', 0) / rates.get('JPY', 1) if rates.get('JPY') else 0
             }
+            MARKET_STATE.publish([Quote(pair, pair, 'forex', rate) for pair, rate in pairs.items()])
+            return pairs
     except:
         pass
     return None
@@ -213,9 +647,7 @@ def get_commodity_prices():
     commodities = {}
     
     # Yahoo Finance for commodities
-    symbols = {'GC=F': 'GOLD', 'SI=F': 'SILVER', 'CL=F': 'CRUDE_OIL', 'HG=F': 'COPPER', 'NG=F': 'NATURAL_GAS'}
-    
-    for symbol, name in symbols.items():
+    for symbol, name in COMMODITY_SYMBOLS.items():
         data = get_yahoo_finance_data(symbol)
         if data:
             commodities[name] = data
@@ -226,6 +658,7 @@ def get_commodity_prices():
 # ECONOMIC DATA
 # ===========================================
 
+@ingest_owned
 def get_fred_data(series_id):
     """FRED API - Completely free, unlimited"""
     if not FRED_KEY:
@@ -247,6 +680,7 @@ def get_fred_data(series_id):
         pass
     return None
 
+@ingest_owned
 def get_economic_indicators():
     """Get key economic indicators from FRED"""
     indicators = {}
@@ -264,6 +698,7 @@ def get_economic_indicators():
 # NEWS
 # ===========================================
 
+@ingest_on_demand
 def get_news(category="general", query=None):
     """NewsAPI - 100 requests/day free"""
     if not NEWS_KEY:
@@ -309,8 +744,6 @@ def get_news(category="general", query=None):
                     'description': desc_clean,
                     'url': article_url
                 })
-                
-                save_mem(url=article_url)
     except Exception as e:
         print(f"News API error: {e}")
     
@@ -331,72 +764,152 @@ def get_finnhub_news(category="general"):
         pass
     return []
 
+# ===========================================
+# LAST-KNOWN-GOOD FALLBACK
+# ===========================================
+# Interactive requests never wait on an upstream longer than FETCH_BUDGET.
+# A fetch that misses the deadline keeps running in the background and
+# refreshes LAST_GOOD (and MARKET_STATE) when it lands. Ages come from the
+# fetch itself, so a worker's copy of ingest's data is as old as ingest's fetch.
+
+STALE_AFTER = 2 * INGEST_INTERVAL
+FETCH_POOL = ThreadPoolExecutor(max_workers=16)
+LAST_GOOD = {}  # "fetcher:args" -> (value, fetched at)
+IN_FLIGHT = {}  # "fetcher:args" -> Future, so a slow source is only polled once at a time
+FALLBACK_LOCK = threading.Lock()
+
+SECTION_TITLES = {
+    'indian': "🇮🇳 *INDIAN MARKETS*",
+    'global': "🌍 *GLOBAL MARKETS*",
+    'crypto': "₿ *CRYPTOCURRENCIES*",
+    'forex': "💱 *FOREX RATES*",
+    'commodities': "🥇 *COMMODITIES*"
+}
+
+SECTION_SOURCES = {
+    'indian': [(get_nse_data, ())],
+    'global': [(get_yahoo_finance_data, (symbol,)) for symbol in GLOBAL_SYMBOLS],
+    'crypto': [(get_crypto_prices, ())],
+    'forex': [(get_currency_rates, ())],
+    'commodities': [(get_yahoo_finance_data, (symbol,)) for symbol in COMMODITY_SYMBOLS],
+    'economic': [(get_economic_indicators, ())]
+}
+
+def _fetch_with_age(fn, *args):
+    if hasattr(fn, 'fetch_with_age'):
+        return fn.fetch_with_age(*args)
+    return fn(*args), time.time()
+
+def _record_result(key, future):
+    with FALLBACK_LOCK:
+        if IN_FLIGHT.get(key) is future:
+            del IN_FLIGHT[key]
+    try:
+        value, fetched = future.result()
+    except Exception:
+        value = None
+    if value:
+        LAST_GOOD[key] = (value, fetched)
+
+def _start_fetch(fn, args):
+    key = f"{fn.__name__}:{','.join(map(str, args))}"
+    with FALLBACK_LOCK:
+        future = IN_FLIGHT.get(key)
+        created = future is None
+        if created:
+            future = IN_FLIGHT[key] = FETCH_POOL.submit(_fetch_with_age, fn, *args)
+    
+    # Outside the lock: the callback runs inline if the future already finished
+    if created:
+        future.add_done_callback(functools.partial(_record_result, key))
+    return key, future
+
+def fetch_with_budget(calls, budget=FETCH_BUDGET):
+    """Run (fn, args) calls concurrently under one deadline
+    
+    budget=None waits for every call, for scheduled runs nobody is waiting on.
+    Returns [(value, as_of)] in call order. as_of is None for fresh data, the
+    fetch timestamp when the last-known-good value was served instead or the
+    data is older than STALE_AFTER, and value is None only when the source
+    has never succeeded.
+    """
+    deadline = None if budget is None else time.monotonic() + budget
+    started = [_start_fetch(fn, args) for fn, args in calls]
+    
+    results = []
+    for key, future in started:
+        try:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            value, fetched = future.result(timeout=timeout)
+        except Exception:
+            value = None
+        
+        if value:
+            results.append((value, fetched if time.time() - fetched > STALE_AFTER else None))
+        elif key in LAST_GOOD:
+            results.append(LAST_GOOD[key])
+        else:
+            results.append((None, None))
+    return results
+
+def fetch_groups(groups, budget=FETCH_BUDGET):
+    """{group: (values, as_of)} with as_of the oldest stale source in the group"""
+    calls = [(group, fn, args) for group in groups for fn, args in SECTION_SOURCES[group]]
+    results = fetch_with_budget([(fn, args) for _, fn, args in calls], budget)
+    
+    status = {group: ([], None) for group in groups}
+    for (group, _, _), (value, as_of) in zip(calls, results):
+        values, oldest = status[group]
+        if value:
+            values.append(value)
+        if as_of and (oldest is None or as_of < oldest):
+            oldest = as_of
+        status[group] = (values, oldest)
+    return status
+
+UNAVAILABLE = "⚠️ Data unavailable right now, please try again shortly."
+
+def as_of_marker(as_of):
+    return f" _(as of {datetime.fromtimestamp(as_of).strftime('%H:%M')})_" if as_of else ""
+
+def render_section(group):
+    """One market section within the latency budget, stale data marked"""
+    values, as_of = fetch_groups([group])[group]
+    if not values:
+        return f"{SECTION_TITLES[group]}\n\n{UNAVAILABLE}"
+    return f"{SECTION_TITLES[group]}{as_of_marker(as_of)}\n\n" + format_group(MARKET_STATE.snapshot(), group)
+
 # ===========================================
 # COMPLETE MARKET OVERVIEW
 # ===========================================
 
-def get_complete_overview():
-    """Get EVERYTHING - all markets, currencies, commodities, crypto"""
+def get_complete_overview(budget=FETCH_BUDGET):
+    """Get EVERYTHING - all markets, currencies, commodities, crypto
+    
+    Scheduled briefings pass budget=None to wait for slow sources.
+    """
     overview = "📊 *COMPLETE FINANCIAL OVERVIEW*\n\n"
     
     bot.send_chat_action(CHAT_ID, "typing")
     
-    # Indian Markets
-    nse_data = get_nse_data()
-    if nse_data:
-        overview += "🇮🇳 *INDIAN MARKETS*\n"
-        for name, data in nse_data.items():
-            emoji = "🟢" if data['change'] >= 0 else "🔴"
-            overview += f"{emoji} *{name}*: ₹{data['last']:,.2f} ({data['change']:+.2f}%)\n"
-        overview += "\n"
+    # Refresh every source under one deadline, then render from one snapshot
+    groups = ['indian', 'global', 'crypto', 'forex', 'commodities'] + (['economic'] if FRED_KEY else [])
+    status = fetch_groups(groups, budget)
+    snap = MARKET_STATE.snapshot()
     
-    # Global Markets
-    overview += "🌍 *GLOBAL MARKETS*\n"
-    global_symbols = {'^DJI': 'DOW JONES', '^GSPC': 'S&P 500', '^IXIC': 'NASDAQ', '^N225': 'NIKKEI'}
-    
-    for symbol, name in global_symbols.items():
-        data = get_yahoo_finance_data(symbol)
-        if data:
-            emoji = "🟢" if data['change_pct'] >= 0 else "🔴"
-            overview += f"{emoji} *{name}*: {data['price']:,.2f} ({data['change_pct']:+.2f}%)\n"
-    overview += "\n"
-    
-    # Cryptocurrencies
-    crypto_data = get_crypto_prices()
-    if crypto_data:
-        overview += "₿ *CRYPTOCURRENCIES*\n"
-        crypto_names = {'bitcoin': 'BTC', 'ethereum': 'ETH', 'binancecoin': 'BNB', 'ripple': 'XRP', 'cardano': 'ADA'}
-        
-        for coin, name in crypto_names.items():
-            if coin in crypto_data:
-                data = crypto_data[coin]
-                emoji = "🟢" if data['change_24h'] >= 0 else "🔴"
-                overview += f"{emoji} *{name}*: ${data['usd']:,.2f} (₹{data['inr']:,.0f}) {data['change_24h']:+.2f}%\n"
-        overview += "\n"
-    
-    # Currencies
-    currencies = get_currency_rates()
-    if currencies:
-        overview += "💱 *FOREX RATES*\n"
-        for pair, rate in currencies.items():
-            if rate > 0:
-                overview += f"• *{pair}*: ₹{rate:.2f}\n"
-        overview += "\n"
-    
-    # Commodities
-    commodities = get_commodity_prices()
-    if commodities:
-        overview += "🥇 *COMMODITIES*\n"
-        for name, data in commodities.items():
-            emoji = "🟢" if data['change_pct'] >= 0 else "🔴"
-            overview += f"{emoji} *{name}*: ${data['price']:,.2f} ({data['change_pct']:+.2f}%)\n"
-        overview += "\n"
+    for group in groups[:5]:
+        values, as_of = status[group]
+        if values:
+            overview += f"{SECTION_TITLES[group]}{as_of_marker(as_of)}\n" + format_group(snap, group) + "\n"
+        else:
+            overview += f"{SECTION_TITLES[group]}\n{UNAVAILABLE}\n\n"
     
     # Economic Indicators
     if FRED_KEY:
-        indicators = get_economic_indicators()
+        values, as_of = status['economic']
+        indicators = values[0] if values else None
         if indicators:
-            overview += "📈 *ECONOMIC INDICATORS*\n"
+            overview += f"📈 *ECONOMIC INDICATORS*{as_of_marker(as_of)}\n"
             if indicators.get('US_GDP'):
                 overview += f"• US GDP: {indicators['US_GDP']['value']} ({indicators['US_GDP']['date']})\n"
             if indicators.get('US_UNEMPLOYMENT'):
@@ -404,11 +917,494 @@ def get_complete_overview():
             if indicators.get('US_INFLATION'):
                 overview += f"• US Inflation (CPI): {indicators['US_INFLATION']['value']}\n"
             overview += "\n"
+        else:
+            overview += f"📈 *ECONOMIC INDICATORS*\n{UNAVAILABLE}\n\n"
     
     overview += f"🕐 *Updated*: {datetime.now().strftime('%I:%M %p IST')}"
     
     return overview
 
+# ===========================================
+# CHARTS
+# ===========================================
+
+CHART_SYMBOLS = {
+    'NIFTY 50': '^NSEI', 'NIFTY': '^NSEI', 'NIFTY BANK': '^NSEBANK', 'BANK NIFTY': '^NSEBANK',
+    'NIFTY IT': '^CNXIT', 'NIFTY PHARMA': '^CNXPHARMA', 'SENSEX': '^BSESN',
+    'DOW JONES': '^DJI', 'S&P 500': '^GSPC', 'NASDAQ': '^IXIC', 'NIKKEI': '^N225',
+    'GOLD': 'GC=F', 'SILVER': 'SI=F', 'CRUDE OIL': 'CL=F',
+    'BITCOIN': 'BTC-USD', 'BTC': 'BTC-USD', 'ETHEREUM': 'ETH-USD', 'ETH': 'ETH-USD'
+}
+
+# timeframe -> (yahoo range, yahoo interval, seconds shown)
+CHART_RANGES = {
+    '1D': ('1d', '5m', 86400),
+    '1W': ('5d', '30m', 7 * 86400),
+    '1M': ('1mo', '1d', 31 * 86400),
+    '6M': ('6mo', '1d', 183 * 86400),
+    '1Y': ('1y', '1wk', 366 * 86400)
+}
+
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_CACHE_SIZE = 64
+CHART_CACHE = OrderedDict()  # (symbol, range, style, last bar ts) -> {'png', 'file_id', 'pending'}
+CHART_LOCK = threading.Lock()
+CHART_POOL = None
+CHART_SENDERS = ThreadPoolExecutor(max_workers=4)  # uploads, kept off the render pool's callback thread
+
+def render_chart_png(bars, title, style="candle"):
+    """Draw candlestick or line chart to PNG bytes (runs in the process pool)"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    
+    x = list(range(len(bars)))
+    opens = [bar[1] for bar in bars]
+    highs = [bar[2] for bar in bars]
+    lows = [bar[3] for bar in bars]
+    closes = [bar[4] for bar in bars]
+    
+    fig, ax = plt.subplots(figsize=(10, 5), dpi=100)
+    
+    if style == "line":
+        color = "#26a69a" if closes[-1] >= closes[0] else "#ef5350"
+        ax.plot(x, closes, color=color, linewidth=1.5)
+        ax.fill_between(x, closes, min(closes), color=color, alpha=0.1)
+    else:
+        colors = ["#26a69a" if c >= o else "#ef5350" for o, c in zip(opens, closes)]
+        ax.vlines(x, lows, highs, colors=colors, linewidth=0.8)
+        ax.bar(x, [abs(c - o) or 1e-9 for o, c in zip(opens, closes)],
+               bottom=[min(o, c) for o, c in zip(opens, closes)], color=colors, width=0.6)
+    
+    # Bars are plotted by index so weekends/overnight gaps don't show up
+    intraday = len(bars) > 1 and bars[-1][0] - bars[0][0] <= 7 * 86400
+    fmt = '%d %b %H:%M' if intraday else '%d %b %y'
+    ticks = x[::max(1, len(x) // 6)]
+    ax.set_xticks(ticks)
+    ax.set_xticklabels([datetime.fromtimestamp(bars[i][0]).strftime(fmt) for i in ticks], fontsize=8)
+    ax.set_title(title)
+    ax.grid(alpha=0.3)
+    fig.tight_layout()
+    
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    plt.close(fig)
+    return buf.getvalue()
+
+def get_chart_pool():
+    global CHART_POOL
+    with CHART_LOCK:
+        if CHART_POOL is None:
+            CHART_POOL = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return CHART_POOL
+
+def _reset_chart_pool(broken):
+    """Drop a pool whose render child died (OOM, crash); the next chart starts a new one"""
+    global CHART_POOL
+    with CHART_LOCK:
+        if CHART_POOL is broken:
+            CHART_POOL = None
+    broken.shutdown(wait=False)
+
+def parse_chart_request(text):
+    """'chart nifty 50 1w line' -> ('NIFTY 50', '1W', 'line')"""
+    words = text.lstrip('/').split()[1:]
+    timeframe, style = '1D', 'candle'
+    
+    if words and words[-1].lower() in ('line', 'candle'):
+        style = words.pop().lower()
+    if words and words[-1].upper() in CHART_RANGES:
+        timeframe = words.pop().upper()
+    
+    name = ' '.join(words).upper() or 'NIFTY 50'
+    return name, timeframe, style
+
+def _chart_cache_put(key, **fields):
+    with CHART_LOCK:
+        entry = CHART_CACHE.setdefault(key, {'png': None, 'file_id': None, 'pending': None})
+        entry.update(fields)
+        if entry['file_id']:
+            entry['png'] = None  # Telegram has it now, no need to keep the bytes
+        CHART_CACHE.move_to_end(key)
+        while len(CHART_CACHE) > CHART_CACHE_SIZE:
+            CHART_CACHE.popitem(last=False)
+
+def _upload_chart(chat_id, key, png, caption):
+    sent = bot.send_photo(chat_id, png, caption=caption, parse_mode="Markdown")
+    if sent and sent.photo:
+        _chart_cache_put(key, file_id=sent.photo[-1].file_id)
+        if SHARED_CACHE:
+            SHARED_CACHE.set(f"chart:{key}", sent.photo[-1].file_id, ex=86400)
+        return sent.photo[-1].file_id
+    return None
+
+def _chart_failed(chat_id, key, pending, error):
+    print(f"Chart error: {error}")
+    with CHART_LOCK:
+        entry = CHART_CACHE.get(key)
+        if entry and entry['pending'] is pending:
+            del CHART_CACHE[key]  # let the next request try again
+    pending.set_exception(error)
+    bot.send_message(chat_id, "⚠️ Could not render chart, try again later")
+
+def _deliver_chart(chat_id, key, caption, pending, pool, future):
+    try:
+        png = future.result()
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            _reset_chart_pool(pool)
+        _chart_failed(chat_id, key, pending, e)
+        return
+    
+    _chart_cache_put(key, png=png, pending=None)
+    file_id = None
+    try:
+        file_id = _upload_chart(chat_id, key, png, caption)
+    except Exception as e:
+        print(f"Chart error: {e}")
+        bot.send_message(chat_id, "⚠️ Could not render chart, try again later")
+    finally:
+        # Requests that arrived during the render reuse the upload, or the bytes
+        pending.set_result((png, file_id))
+
+def _deliver_chart_copy(chat_id, key, caption, pending):
+    try:
+        png, file_id = pending.result()
+        if file_id:
+            bot.send_photo(chat_id, file_id, caption=caption, parse_mode="Markdown")
+        else:
+            _upload_chart(chat_id, key, png, caption)
+    except Exception as e:
+        print(f"Chart error: {e}")
+        bot.send_message(chat_id, "⚠️ Could not render chart, try again later")
+
+def _render_chart(chat_id, key, caption, bars, title, style):
+    """Render each key once; requests arriving meanwhile wait on the same render"""
+    with CHART_LOCK:
+        entry = CHART_CACHE.setdefault(key, {'png': None, 'file_id': None, 'pending': None})
+        pending = entry['pending']
+        owner = pending is None and not entry['png'] and not entry['file_id']
+        if owner:
+            pending = entry['pending'] = Future()
+        elif pending is None:
+            # Finished between send_chart's lookup and here
+            pending = Future()
+            pending.set_result((entry['png'], entry['file_id']))
+    
+    if not owner:
+        pending.add_done_callback(lambda f: CHART_SENDERS.submit(_deliver_chart_copy, chat_id, key, caption, f))
+        return
+    
+    bot.send_chat_action(chat_id, "upload_photo")
+    for attempt in range(2):
+        pool = get_chart_pool()
+        try:
+            future = pool.submit(render_chart_png, bars, title, style)
+            break
+        except BrokenProcessPool as e:
+            _reset_chart_pool(pool)
+            if attempt:
+                _chart_failed(chat_id, key, pending, e)
+                return
+    future.add_done_callback(lambda f: CHART_SENDERS.submit(_deliver_chart, chat_id, key, caption, pending, pool, f))
+
+def send_chart(chat_id, name, timeframe="1D", style="candle"):
+    """Send a chart, reusing the cached Telegram file_id when nothing changed"""
+    symbol = CHART_SYMBOLS.get(name, name)
+    range_, interval, span = CHART_RANGES[timeframe]
+    
+    bars, as_of = get_price_history(symbol, range_, interval, span)
+    if not bars or len(bars) < 2:
+        bot.send_message(chat_id, f"⚠️ No price history for *{name}*", parse_mode="Markdown")
+        return
+    
+    key = (symbol, range_, style, bars[-1][0])
+    caption = f"📈 *{name}* · {timeframe} · {bars[-1][4]:,.2f}{as_of_marker(as_of)}"
+    
+    with CHART_LOCK:
+        entry = dict(CHART_CACHE.get(key) or {})
+        if entry:
+            CHART_CACHE.move_to_end(key)
+    
+    if not entry and SHARED_CACHE:
+        # Another worker may already have uploaded this exact chart
+        entry = {'file_id': SHARED_CACHE.get(f"chart:{key}")}
+    
+    if entry.get('file_id'):
+        bot.send_photo(chat_id, entry['file_id'], caption=caption, parse_mode="Markdown")
+    elif entry.get('png'):
+        _upload_chart(chat_id, key, entry['png'], caption)
+    else:
+        _render_chart(chat_id, key, caption, bars, f"{name} ({timeframe})", style)
+
+# ===========================================
+# TECHNICAL INDICATORS
+# ===========================================
+# Batch functions take NumPy arrays over a full history and return arrays
+# (NaN during warm-up). IndicatorState produces the same numbers one tick at
+# a time in O(1), so the monitor never recomputes a whole window. VWAP is
+# batch-only: the NSE index feed the monitor streams carries no volume.
+
+def _ema_filter(values, alpha, seed):
+    """y[i] = (1 - alpha) * y[i-1] + alpha * values[i], starting from seed"""
+    out = np.empty(len(values))
+    decay = 1.0 - alpha
+    
+    # Closed form per block; blocks keep decay ** -k far from overflow
+    for start in range(0, len(values), 128):
+        chunk = values[start:start + 128]
+        if decay == 0:
+            out[start:start + len(chunk)] = chunk
+        else:
+            k = np.arange(len(chunk))
+            acc = np.cumsum(chunk * decay ** -k)
+            out[start:start + len(chunk)] = decay ** (k + 1) * seed + alpha * decay ** k * acc
+        seed = out[start + len(chunk) - 1]
+    return out
+
+def _seeded_average(values, period, alpha):
+    """SMA over the first `period` values, exponential smoothing after"""
+    out = np.full(len(values), np.nan)
+    if len(values) < period:
+        return out
+    out[period - 1] = values[:period].mean()
+    out[period:] = _ema_filter(values[period:], alpha, out[period - 1])
+    return out
+
+def sma(values, period=20):
+    values = np.asarray(values, dtype=float)
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        out[period - 1:] = np.lib.stride_tricks.sliding_window_view(values, period).mean(axis=1)
+    return out
+
+def ema(values, period=20):
+    return _seeded_average(np.asarray(values, dtype=float), period, 2.0 / (period + 1))
+
+def rsi(closes, period=14):
+    """Wilder's RSI"""
+    closes = np.asarray(closes, dtype=float)
+    out = np.full(len(closes), np.nan)
+    if len(closes) < 2:
+        return out
+    
+    deltas = np.diff(closes)
+    avg_gain = _seeded_average(np.maximum(deltas, 0), period, 1.0 / period)
+    avg_loss = _seeded_average(np.maximum(-deltas, 0), period, 1.0 / period)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Flat prices (no gains, no losses) are neutral, not overbought
+        out[1:] = np.where(avg_loss == 0, np.where(avg_gain == 0, 50.0, 100.0),
+                           100.0 - 100.0 / (1.0 + avg_gain / avg_loss))
+    return out
+
+def macd(closes, fast=12, slow=26, signal=9):
+    """Returns (macd line, signal line, histogram)"""
+    closes = np.asarray(closes, dtype=float)
+    line = ema(closes, fast) - ema(closes, slow)
+    sig = np.full(len(closes), np.nan)
+    if len(closes) >= slow:
+        sig[slow - 1:] = ema(line[slow - 1:], signal)
+    return line, sig, line - sig
+
+def bollinger(closes, period=20, k=2.0):
+    """Returns (upper, middle, lower) using population std"""
+    closes = np.asarray(closes, dtype=float)
+    mid = np.full(len(closes), np.nan)
+    std = np.full(len(closes), np.nan)
+    if len(closes) >= period:
+        windows = np.lib.stride_tricks.sliding_window_view(closes, period)
+        mid[period - 1:] = windows.mean(axis=1)
+        std[period - 1:] = windows.std(axis=1)
+    return mid + k * std, mid, mid - k * std
+
+def vwap(highs, lows, closes, volumes):
+    highs, lows, closes, volumes = (np.asarray(a, dtype=float) for a in (highs, lows, closes, volumes))
+    typical = (highs + lows + closes) / 3
+    cum_vol = np.cumsum(volumes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(cum_vol > 0, np.cumsum(typical * volumes) / cum_vol, np.nan)
+
+def atr(highs, lows, closes, period=14):
+    """Wilder's Average True Range"""
+    highs, lows, closes = (np.asarray(a, dtype=float) for a in (highs, lows, closes))
+    tr = highs - lows
+    if len(tr) > 1:
+        tr[1:] = np.maximum.reduce([tr[1:], np.abs(highs[1:] - closes[:-1]), np.abs(lows[1:] - closes[:-1])])
+    return _seeded_average(tr, period, 1.0 / period)
+
+class _SeededAverage:
+    """Streaming _seeded_average"""
+    __slots__ = ('period', 'alpha', 'count', 'total', 'value')
+    
+    def __init__(self, period, alpha):
+        self.period, self.alpha = period, alpha
+        self.count, self.total, self.value = 0, 0.0, None
+    
+    def update(self, x):
+        if self.count < self.period:
+            self.count += 1
+            self.total += x
+            if self.count == self.period:
+                self.value = self.total / self.period
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+class _RollingWindow:
+    """Fixed window mean/std with O(1) add-and-drop updates"""
+    __slots__ = ('period', 'values', 'mean', 'm2')
+    
+    def __init__(self, period):
+        self.period = period
+        self.values = deque()
+        self.mean, self.m2 = 0.0, 0.0
+    
+    def update(self, x):
+        if len(self.values) < self.period:
+            self.values.append(x)
+            delta = x - self.mean
+            self.mean += delta / len(self.values)
+            self.m2 += delta * (x - self.mean)
+        else:
+            old = self.values.popleft()
+            self.values.append(x)
+            prev_mean = self.mean
+            self.mean += (x - old) / self.period
+            self.m2 += (x - old) * (x - self.mean + old - prev_mean)
+    
+    @property
+    def ready(self):
+        return len(self.values) == self.period
+    
+    @property
+    def std(self):
+        return (max(self.m2, 0.0) / self.period) ** 0.5
+
+class IndicatorState:
+    """Rolling indicators for one symbol, updated one price at a time"""
+    
+    def __init__(self, sma_period=20, ema_period=20, rsi_period=14, macd_fast=12, macd_slow=26,
+                 macd_signal=9, bb_period=20, bb_k=2.0, atr_period=14):
+        self.bb_k = bb_k
+        self._sma = _RollingWindow(sma_period)
+        self._bb = _RollingWindow(bb_period)
+        self._ema = _SeededAverage(ema_period, 2.0 / (ema_period + 1))
+        self._fast = _SeededAverage(macd_fast, 2.0 / (macd_fast + 1))
+        self._slow = _SeededAverage(macd_slow, 2.0 / (macd_slow + 1))
+        self._signal = _SeededAverage(macd_signal, 2.0 / (macd_signal + 1))
+        self._gain = _SeededAverage(rsi_period, 1.0 / rsi_period)
+        self._loss = _SeededAverage(rsi_period, 1.0 / rsi_period)
+        self._atr = _SeededAverage(atr_period, 1.0 / atr_period)
+        self.last_close = None
+        self.values = {}
+    
+    def update(self, close, high=None, low=None):
+        """Feed one bar/tick (ticks without a range use close for high/low)"""
+        high = close if high is None else high
+        low = close if low is None else low
+        prev = self.last_close
+        v = self.values
+        
+        self._sma.update(close)
+        self._bb.update(close)
+        v['sma'] = self._sma.mean if self._sma.ready else None
+        v['ema'] = self._ema.update(close)
+        
+        if self._bb.ready:
+            band = self.bb_k * self._bb.std
+            v['bb_upper'], v['bb_mid'], v['bb_lower'] = self._bb.mean + band, self._bb.mean, self._bb.mean - band
+        else:
+            v['bb_upper'] = v['bb_mid'] = v['bb_lower'] = None
+        
+        fast, slow = self._fast.update(close), self._slow.update(close)
+        if slow is not None:
+            v['macd'] = fast - slow
+            v['macd_signal'] = self._signal.update(v['macd'])
+            v['macd_hist'] = v['macd'] - v['macd_signal'] if v['macd_signal'] is not None else None
+        else:
+            v['macd'] = v['macd_signal'] = v['macd_hist'] = None
+        
+        if prev is not None:
+            gain = self._gain.update(max(close - prev, 0.0))
+            loss = self._loss.update(max(prev - close, 0.0))
+            if gain is not None:
+                if loss == 0:
+                    v['rsi'] = 50.0 if gain == 0 else 100.0
+                else:
+                    v['rsi'] = 100.0 - 100.0 / (1.0 + gain / loss)
+            tr = max(high - low, abs(high - prev), abs(low - prev))
+        else:
+            tr = high - low
+        v.setdefault('rsi', None)
+        v['atr'] = self._atr.update(tr)
+        
+        v['price'] = self.last_close = close
+        return v
+
+INDICATOR_STATE = {}
+
+def update_indicators(symbol, price, high=None, low=None):
+    """Per-symbol streaming update used by the alert loop
+    
+    One tick per monitor pass, so periods count MONITOR_INTERVAL ticks, not days.
+    """
+    if symbol not in INDICATOR_STATE:
+        INDICATOR_STATE[symbol] = IndicatorState()
+    return INDICATOR_STATE[symbol].update(price, high, low)
+
+def compute_indicators(bars):
+    """Latest indicator values over stored history bars (batch path)"""
+    bars = np.asarray(bars, dtype=float)
+    highs, lows, closes, volumes = bars[:, 2], bars[:, 3], bars[:, 4], bars[:, 5]
+    
+    upper, mid, lower = bollinger(closes)
+    line, sig, hist = macd(closes)
+    values = {
+        'price': closes[-1], 'sma': sma(closes)[-1], 'ema': ema(closes)[-1], 'rsi': rsi(closes)[-1],
+        'macd': line[-1], 'macd_signal': sig[-1], 'macd_hist': hist[-1],
+        'bb_upper': upper[-1], 'bb_mid': mid[-1], 'bb_lower': lower[-1],
+        'vwap': vwap(highs, lows, closes, volumes)[-1], 'atr': atr(highs, lows, closes)[-1]
+    }
+    return {k: (None if np.isnan(val) else float(val)) for k, val in values.items()}
+
+def describe_signals(values):
+    """Short human-readable signals from an indicator dict"""
+    signals = []
+    
+    if values.get('rsi') is not None:
+        state = " overbought" if values['rsi'] > 70 else " oversold" if values['rsi'] < 30 else ""
+        signals.append(f"RSI {values['rsi']:.0f}{state}")
+    
+    # Ignore float noise around zero (flat prices)
+    if values.get('macd_hist') is not None and abs(values['macd_hist']) > abs(values['price']) * 1e-9:
+        signals.append("MACD bullish" if values['macd_hist'] > 0 else "MACD bearish")
+    
+    if values.get('bb_upper') is not None:
+        if values['price'] > values['bb_upper']:
+            signals.append("above upper band")
+        elif values['price'] < values['bb_lower']:
+            signals.append("below lower band")
+    
+    if values.get('sma') is not None:
+        signals.append("above SMA20" if values['price'] >= values['sma'] else "below SMA20")
+    
+    return signals
+
+def get_signals_briefing():
+    """Daily-bar signals for the briefings"""
+    msg = ""
+    for name in ['NIFTY 50', 'NIFTY BANK', 'SENSEX']:
+        bars, _ = get_price_history(CHART_SYMBOLS[name], '6mo', '1d', budget=None)
+        if not bars or len(bars) < 30:
+            continue
+        
+        values = compute_indicators(bars)
+        atr_txt = f" · ATR {values['atr']:,.0f}" if values['atr'] is not None else ""
+        msg += f"• *{name}*: {', '.join(describe_signals(values))}{atr_txt}\n"
+    
+    return f"📐 *TECHNICAL SIGNALS* _(daily bars)_\n{msg}" if msg else ""
+
 # ===========================================
 # ENHANCED INTERACTIVE MENU
 # ===========================================
@@ -440,14 +1436,98 @@ def get_reply_keyboard():
     markup.add("🔄 Refresh", "❌ Hide")
     return markup
 
+# ===========================================
+# ALERT STATE
+# ===========================================
+
+# rule -> (fire at, re-arm below, cooldown seconds); values are % moves
+ALERT_RULES = {
+    'crash': (1.5, 1.2, 1800),
+    'surge': (1.5, 1.2, 1800),
+    'rapid': (0.5, 0.3, 600)
+}
+
+class AlertState:
+    """Cooldown and hysteresis per (user, symbol, rule), bounded with TTL eviction
+    
+    A rule fires when its value crosses the trigger, then stays quiet until the
+    value falls back under the re-arm level and the cooldown has passed.
+    """
+    
+    def __init__(self, max_entries=5000, ttl=6 * 3600, seen_interval=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Last-seen times are persisted at most this stale, so a condition
+        # held past the TTL isn't evicted and re-fired after a restart
+        self.seen_interval = seen_interval
+        self.dirty = False
+        self._saved_at = time.time()
+        self._entries = OrderedDict()  # "user|symbol|rule" -> [last fired, armed, last seen]
+        self._lock = threading.Lock()
+    
+    def check(self, user, symbol, rule, value, now=None):
+        """True if this alert should be sent now (and records that it was)"""
+        trigger, rearm, cooldown = ALERT_RULES[rule]
+        now = time.time() if now is None else now
+        key = f"{user}|{symbol}|{rule}"
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            
+            if entry is None:
+                if value < trigger:
+                    return False  # nothing to remember for quiet symbols
+                entry = self._entries[key] = [None, True, now]
+            else:
+                entry[2] = now
+                self._entries.move_to_end(key)
+                if now - self._saved_at >= self.seen_interval:
+                    self.dirty = True
+            self._evict(now)
+            
+            if entry[1]:
+                if value >= trigger and (entry[0] is None or now - entry[0] >= cooldown):
+                    entry[0], entry[1] = now, False
+                    self.dirty = True
+                    return True
+            elif value < rearm:
+                entry[1] = True
+                self.dirty = True
+            return False
+    
+    def _evict(self, now):
+        # Least recently seen entries sit at the front
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if now - entry[2] <= self.ttl and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+            self.dirty = True
+    
+    def to_dict(self):
+        with self._lock:
+            self.dirty = False
+            self._saved_at = time.time()
+            return {key: list(entry) for key, entry in self._entries.items()}
+    
+    def load(self, data):
+        with self._lock:
+            for key, entry in sorted((data or {}).items(), key=lambda item: item[1][2]):
+                self._entries[key] = list(entry)
+            self._evict(time.time())
+
+ALERTS = AlertState()
+
 # ===========================================
 # MARKET MONITOR (Background Thread)
 # ===========================================
 
+MONITOR_INTERVAL = 120  # seconds between NSE checks, and so between indicator ticks
+
 def monitor_markets():
     """Smart market monitoring with alerts"""
-    global ALERT_SENT
     last_check = {}
+    ALERTS.load(load_alert_state())
     
     print("🔍 Market Monitor: ACTIVE")
     
@@ -466,50 +1546,50 @@ def monitor_markets():
             indices = get_nse_data()
             
             if not indices:
-                time.sleep(120)
+                time.sleep(MONITOR_INTERVAL)
                 continue
             
-            for name, data in indices.items():
-                current = data['last']
-                change_pct = data['change']
-                point_change = current - data['open']
+            for quote in MARKET_STATE.snapshot().group('indian'):
+                name = quote.name
+                current = quote.price
+                change_pct = quote.change_pct
+                point_change = current - quote.open
+                signals = describe_signals(update_indicators(name, current))
                 
-                alert_msg = None
+                alerts = []
                 
                 # Big moves
-                if abs(change_pct) > 1.5:
-                    if change_pct < -1.5:
-                        alert_msg = f"🚨 *CRASH ALERT*\n\n*{name}* down *{abs(change_pct):.2f}%*!\n\nCurrent: ₹{current:,.2f}\nDrop: {point_change:,.0f} points"
-                    else:
-                        alert_msg = f"🚀 *SURGE ALERT*\n\n*{name}* up *{change_pct:.2f}%*!\n\nCurrent: ₹{current:,.2f}\nGain: +{point_change:,.0f} points"
+                if ALERTS.check(CHAT_ID, name, 'crash', -change_pct):
+                    alerts.append(f"🚨 *CRASH ALERT*\n\n*{name}* down *{abs(change_pct):.2f}%*!\n\nCurrent: ₹{current:,.2f}\nDrop: {point_change:,.0f} points")
+                if ALERTS.check(CHAT_ID, name, 'surge', change_pct):
+                    alerts.append(f"🚀 *SURGE ALERT*\n\n*{name}* up *{change_pct:.2f}%*!\n\nCurrent: ₹{current:,.2f}\nGain: +{point_change:,.0f} points")
                 
                 # Rapid change detection
                 if name in last_check:
                     last_price = last_check[name]
                     quick_change = ((current - last_price) / last_price) * 100
                     
-                    if abs(quick_change) > 0.5:
-                        alert_msg = f"⚡ *RAPID MOVE*\n\n*{name}* moved *{quick_change:+.2f}%* in 2 minutes!\n\nCurrent: ₹{current:,.2f}"
-                
-                # Send alert with cooldown
-                alert_key = f"{name}_{datetime.now().strftime('%Y%m%d%H%M')[:-1]}"
+                    if ALERTS.check(CHAT_ID, name, 'rapid', abs(quick_change)):
+                        alerts.append(f"⚡ *RAPID MOVE*\n\n*{name}* moved *{quick_change:+.2f}%* in {MONITOR_INTERVAL // 60} minutes!\n\nCurrent: ₹{current:,.2f}")
                 
-                if alert_msg and alert_key not in ALERT_SENT:
+                for alert_msg in alerts:
+                    if signals:
+                        # Streamed from this loop's ticks, not the daily bars the briefing uses
+                        alert_msg += f"\n\n📐 _{MONITOR_INTERVAL // 60}-min ticks_: {' · '.join(signals)}"
                     try:
                         bot.send_message(CHAT_ID, alert_msg, parse_mode="Markdown")
-                        ALERT_SENT[alert_key] = True
                     except:
                         pass
                 
                 last_check[name] = current
             
-            if len(ALERT_SENT) > 50:
-                ALERT_SENT.clear()
+            if ALERTS.dirty:
+                save_alert_state(ALERTS.to_dict())
         
         except Exception as e:
             print(f"Monitor error: {e}")
         
-        time.sleep(120)
+        time.sleep(MONITOR_INTERVAL)
 
 # ===========================================
 # SCHEDULED BRIEFINGS
@@ -529,7 +1609,10 @@ def scheduled_updates():
                 header = "🤵 *MORNING BRIEFING*\n"
                 header += f"📅 {now.strftime('%d %B %Y, %I:%M %p')}\n\n"
                 
-                overview = get_complete_overview()
+                overview = get_complete_overview(budget=None)
+                signals = get_signals_briefing()
+                if signals:
+                    overview += "\n\n" + signals
                 bot.send_message(CHAT_ID, header + overview, parse_mode="Markdown")
                 
                 time.sleep(60)
@@ -543,7 +1626,10 @@ def scheduled_updates():
                 header = "🤵 *EVENING BRIEFING*\n"
                 header += f"📅 {now.strftime('%d %B %Y, %I:%M %p')}\n\n"
                 
-                overview = get_complete_overview()
+                overview = get_complete_overview(budget=None)
+                signals = get_signals_briefing()
+                if signals:
+                    overview += "\n\n" + signals
                 bot.send_message(CHAT_ID, header + overview, parse_mode="Markdown")
                 
                 time.sleep(60)
@@ -560,15 +1646,24 @@ def scheduled_updates():
 # HELPER FUNCTIONS
 # ===========================================
 
-def send_news_items(news_items, title="News"):
-    """Send formatted news"""
+def get_news_within_budget(query):
+    """(news, as_of) from NewsAPI, or the last fetched batch if it is slow"""
+    [(news, as_of)] = fetch_with_budget([(get_news, ("general", query))])
+    return news, as_of
+
+def send_news_items(news_items, title="News", as_of=None):
+    """Send formatted news, skipping anything already sent"""
+    # A fallback batch can hold items sent since it was fetched
+    seen = set(load_mem().get("seen_urls", []))
+    news_items = [item for item in news_items or [] if item['url'] not in seen]
+    
     if not news_items:
         bot.send_message(CHAT_ID, "No new news available")
         return
     
     bot.send_chat_action(CHAT_ID, "typing")
     
-    msg = f"📰 *{title.upper()}*\n\n"
+    msg = f"📰 *{title.upper()}*{as_of_marker(as_of)}\n\n"
     
     for item in news_items:
         msg += f"📌 *{item['source'].upper()}*\n"
@@ -585,6 +1680,9 @@ def send_news_items(news_items, title="News"):
             small_msg = f"📰 *{item['source']}*: {item['title']}\n🔗 [Read]({item['url']})"
             bot.send_message(CHAT_ID, small_msg, parse_mode="Markdown", disable_web_page_preview=True)
             time.sleep(0.5)
+    
+    for item in news_items:
+        save_mem(url=item['url'])
 
 # ===========================================
 # HANDLERS
@@ -600,7 +1698,8 @@ def start(message):
         "✅ Forex & Commodities\n"
         "✅ Economic Indicators\n"
         "✅ Real-time News\n"
-        "✅ Smart Alerts\n\n"
+        "✅ Smart Alerts\n"
+        "✅ Charts: `chart nifty 50 1w`\n\n"
         "_Choose an option:_"
     )
     
@@ -625,49 +1724,30 @@ def handle_text(message):
     
     bot.send_chat_action(message.chat.id, "typing")
     
-    if any(word in text for word in ['overview', 'market', 'complete']):
+    if text.lstrip('/').startswith('chart'):
+        name, timeframe, style = parse_chart_request(message.text)
+        send_chart(message.chat.id, name, timeframe, style)
+    
+    elif any(word in text for word in ['overview', 'market', 'complete']):
         msg = bot.send_message(message.chat.id, "⏳ Loading complete overview...")
         overview = get_complete_overview()
         bot.edit_message_text(overview, message.chat.id, msg.message_id, parse_mode="Markdown")
     
     elif 'indian' in text or 'nifty' in text or 'sensex' in text:
-        nse_data = get_nse_data()
-        if nse_data:
-            msg = "🇮🇳 *INDIAN MARKETS*\n\n"
-            for name, data in nse_data.items():
-                emoji = "🟢" if data['change'] >= 0 else "🔴"
-                msg += f"{emoji} *{name}*: ₹{data['last']:,.2f} ({data['change']:+.2f}%)\n"
-            bot.send_message(message.chat.id, msg, parse_mode="Markdown")
+        bot.send_message(message.chat.id, render_section('indian'), parse_mode="Markdown")
     
     elif 'crypto' in text or 'bitcoin' in text:
-        crypto = get_crypto_prices()
-        if crypto:
-            msg = "₿ *CRYPTOCURRENCIES*\n\n"
-            for coin, data in crypto.items():
-                emoji = "🟢" if data['change_24h'] >= 0 else "🔴"
-                msg += f"{emoji} *{coin.upper()}*: ${data['usd']:,.2f} ({data['change_24h']:+.2f}%)\n"
-            bot.send_message(message.chat.id, msg, parse_mode="Markdown")
+        bot.send_message(message.chat.id, render_section('crypto'), parse_mode="Markdown")
     
     elif 'news' in text or 'headlines' in text:
-        news = get_news(query="finance OR business OR economy")
-        send_news_items(news, "Latest Financial News")
+        news, as_of = get_news_within_budget("finance OR business OR economy")
+        send_news_items(news, "Latest Financial News", as_of)
     
     elif 'forex' in text or 'currency' in text:
-        currencies = get_currency_rates()
-        if currencies:
-            msg = "💱 *FOREX RATES*\n\n"
-            for pair, rate in currencies.items():
-                msg += f"• *{pair}*: ₹{rate:.2f}\n"
-            bot.send_message(message.chat.id, msg, parse_mode="Markdown")
+        bot.send_message(message.chat.id, render_section('forex'), parse_mode="Markdown")
     
     elif 'commodit' in text or 'gold' in text or 'oil' in text:
-        commodities = get_commodity_prices()
-        if commodities:
-            msg = "🥇 *COMMODITIES*\n\n"
-            for name, data in commodities.items():
-                emoji = "🟢" if data['change_pct'] >= 0 else "🔴"
-                msg += f"{emoji} *{name}*: ${data['price']:,.2f} ({data['change_pct']:+.2f}%)\n"
-            bot.send_message(message.chat.id, msg, parse_mode="Markdown")
+        bot.send_message(message.chat.id, render_section('commodities'), parse_mode="Markdown")
     
     elif 'refresh' in text or 'update' in text:
         bot.send_message(message.chat.id, "🔄 Refreshing...", reply_markup=get_main_menu())
@@ -676,7 +1756,7 @@ def handle_text(message):
         bot.send_message(message.chat.id, "✅ Keyboard hidden", reply_markup=types.ReplyKeyboardRemove())
     
     else:
-        bot.send_message(message.chat.id, "👋 Use buttons or type: overview, news, crypto, forex", reply_markup=get_main_menu())
+        bot.send_message(message.chat.id, "👋 Use buttons or type: overview, news, crypto, forex, chart nifty 50 1w", reply_markup=get_main_menu())
 
 @bot.callback_query_handler(func=lambda call: True)
 def handle_callbacks(call):
@@ -693,51 +1773,282 @@ def handle_callbacks(call):
             bot.edit_message_text(overview, cid, msg.message_id, parse_mode="Markdown")
         
         elif call.data == "indian":
-            nse_data = get_nse_data()
-            if nse_data:
-                msg = "🇮🇳 *INDIAN MARKETS*\n\n"
-                for name, data in nse_data.items():
-                    emoji = "🟢" if data['change'] >= 0 else "🔴"
-                    msg += f"{emoji} *{name}*: ₹{data['last']:,.2f} ({data['change']:+.2f}%)\n"
-                bot.send_message(cid, msg, parse_mode="Markdown")
+            bot.send_message(cid, render_section('indian'), parse_mode="Markdown")
         
         elif call.data == "crypto":
-            crypto = get_crypto_prices()
-            if crypto:
-                msg = "₿ *CRYPTOCURRENCIES*\n\n"
-                crypto_names = {'bitcoin': 'BTC', 'ethereum': 'ETH', 'binancecoin': 'BNB'}
-                for coin, name in crypto_names.items():
-                    if coin in crypto:
-                        data = crypto[coin]
-                        emoji = "🟢" if data['change_24h'] >= 0 else "🔴"
-                        msg += f"{emoji} *{name}*: ${data['usd']:,.2f} (₹{data['inr']:,.0f}) {data['change_24h']:+.2f}%\n"
-                bot.send_message(cid, msg, parse_mode="Markdown")
+            bot.send_message(cid, render_section('crypto'), parse_mode="Markdown")
         
         elif call.data == "news":
-            news = get_news(query="finance OR business")
-            send_news_items(news, "Latest Financial News")
+            news, as_of = get_news_within_budget("finance OR business")
+            send_news_items(news, "Latest Financial News", as_of)
         
         elif call.data == "forex":
-            currencies = get_currency_rates()
-            if currencies:
-                msg = "💱 *FOREX RATES*\n\n"
-                for pair, rate in currencies.items():
-                    if rate > 0:
-                        msg += f"• *{pair}*: ₹{rate:.2f}\n"
-                bot.send_message(cid, msg, parse_mode="Markdown")
+            bot.send_message(cid, render_section('forex'), parse_mode="Markdown")
         
         elif call.data == "commodities":
-            commodities = get_commodity_prices()
-            if commodities:
-                msg = "🥇 *COMMODITIES*\n\n"
-                for name, data in commodities.items():
-                    emoji = "🟢" if data['change_pct'] >= 0 else "🔴"
-                    msg += f"{emoji} *{name}*: ${data['price']:,.2f} ({data['change_pct']:+.2f}%)\n"
-                bot.send_message(cid, msg, parse_mode="Markdown")
+            bot.send_message(cid, render_section('commodities'), parse_mode="Markdown")
     
     except Exception as e:
         bot.send_message(cid, f"⚠️ Error: {str(e)[:100]}")
 
+# ===========================================
+# SHARDED DEPLOYMENT
+# ===========================================
+# main process: long-polls Telegram, routes each update to a worker by chat id
+# ingest:       polls every upstream source, runs the monitor and briefings,
+#               and fetches history/news on request from workers
+# workers:      stateless handlers + chart rendering, read the shared cache
+# sender:       the only process talking to the Bot API, owns rate limits
+
+OUTBOUND_METHODS = ['send_message', 'send_photo', 'edit_message_text', 'send_chat_action', 'answer_callback_query']
+FIRE_AND_FORGET = {'send_chat_action', 'answer_callback_query'}
+
+class OutboundClient:
+    """Forwards bot API calls to the sender process and waits for the reply"""
+    
+    def __init__(self, name, outbox, inbox, timeout=60):
+        self.name, self.outbox, self.inbox, self.timeout = name, outbox, inbox, timeout
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._read_replies, daemon=True).start()
+    
+    def call(self, method, *args, **kwargs):
+        if method in FIRE_AND_FORGET:
+            self.outbox.put((self.name, None, method, args, kwargs))
+            return None
+        
+        req_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._pending[req_id] = future
+        self.outbox.put((self.name, req_id, method, args, kwargs))
+        
+        try:
+            return future.result(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self._pending.pop(req_id, None)
+    
+    def _read_replies(self):
+        while True:
+            req_id, result, error = self.inbox.get()
+            with self._lock:
+                future = self._pending.get(req_id)
+            if future is None:
+                continue
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(result)
+
+def route_bot_through(client):
+    """Point this process's bot at the sender instead of the Bot API"""
+    for method in OUTBOUND_METHODS:
+        setattr(bot, method, functools.partial(client.call, method))
+
+def _outbound_chat_id(method, args, kwargs):
+    if method == 'answer_callback_query':
+        return None
+    if method == 'edit_message_text':
+        return kwargs.get('chat_id', args[1] if len(args) > 1 else None)
+    return kwargs.get('chat_id', args[0] if args else None)
+
+class OutboundScheduler:
+    """Per-chat FIFO queues, released when the rate limits allow, run on a thread pool
+    
+    Only the limits are shared: a chat waiting out its gap never holds up other
+    chats, and several Bot API calls can be in flight at once. Each chat has at
+    most one call in flight, so its messages still arrive in order.
+    """
+    
+    def __init__(self, outbox, replies, threads=8, per_second=30, per_chat_interval=1.0):
+        self.outbox, self.replies = outbox, replies
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.interval = 1.0 / per_second
+        self.per_chat_interval = per_chat_interval
+        self.next_slot = 0.0       # global limit
+        self.free = deque()        # typing indicators etc: no per-chat gap or ordering
+        self.chats = {}            # chat_id -> deque of pending calls
+        self.chat_next = {}        # chat_id -> earliest time its next call may go
+        self.busy = set()          # chats with a call in flight
+        self.due = []              # heap of (time, seq, chat_id) for idle chats with work
+        self._seq = itertools.count()
+    
+    def run(self):
+        while True:
+            self._dispatch()
+            try:
+                item = self.outbox.get(timeout=self._timeout())
+            except queue.Empty:
+                continue
+            self._enqueue(item)
+    
+    def _enqueue(self, item):
+        name, req_id, method, args, kwargs = item
+        if name is None:
+            return self._finish(req_id)  # completion notice from _execute
+        
+        if method in FIRE_AND_FORGET:
+            self.free.append(item)
+            return
+        
+        chat = _outbound_chat_id(method, args, kwargs)
+        pending = self.chats.setdefault(chat, deque())
+        pending.append(item)
+        if len(pending) == 1 and chat not in self.busy:
+            heapq.heappush(self.due, (self.chat_next.get(chat, 0.0), next(self._seq), chat))
+    
+    def _finish(self, chat):
+        self.busy.discard(chat)
+        if self.chats.get(chat):
+            heapq.heappush(self.due, (self.chat_next[chat], next(self._seq), chat))
+        else:
+            self.chats.pop(chat, None)
+    
+    def _dispatch(self):
+        now = time.monotonic()
+        while self.next_slot <= now:
+            if self.free:
+                item, chat = self.free.popleft(), None
+            elif self.due and self.due[0][0] <= now:
+                chat = heapq.heappop(self.due)[2]
+                item = self.chats[chat].popleft()
+                self.busy.add(chat)
+                self.chat_next[chat] = now + self.per_chat_interval
+            else:
+                break
+            
+            self.next_slot = max(self.next_slot, now) + self.interval
+            self.pool.submit(self._execute, item, item[2] not in FIRE_AND_FORGET, chat)
+        
+        if len(self.chat_next) > 10000:
+            self.chat_next = {c: t for c, t in self.chat_next.items() if t > now or c in self.chats}
+    
+    def _timeout(self):
+        now = time.monotonic()
+        if self.free or (self.due and self.due[0][0] <= now):
+            return max(0.0, self.next_slot - now)
+        if self.due:
+            return max(self.due[0][0], self.next_slot) - now
+        return None
+    
+    def _execute(self, item, tracked, chat):
+        name, req_id, method, args, kwargs = item
+        result, error = None, None
+        try:
+            result = getattr(bot, method)(*args, **kwargs)
+        except Exception as e:
+            error = str(e)[:500] or type(e).__name__
+            print(f"Sender error ({method}): {error}")
+        
+        if req_id is not None:
+            self.replies[name].put((req_id, result, error))
+        if tracked:
+            self.outbox.put((None, chat, None, (), {}))
+
+def run_sender(outbox, replies):
+    """Sender process: the only one calling the Bot API, owns the rate limits"""
+    global ROLE
+    ROLE = "sender"
+    OutboundScheduler(outbox, replies).run()
+
+def ingest_markets():
+    """Poll every upstream market source on a fixed cadence"""
+    while True:
+        try:
+            get_nse_data()
+            for symbol in GLOBAL_SYMBOLS:
+                get_yahoo_finance_data(symbol)
+            get_crypto_prices()
+            get_currency_rates()
+            get_commodity_prices()
+            get_economic_indicators()
+        except Exception as e:
+            print(f"Ingest error: {e}")
+        
+        time.sleep(INGEST_INTERVAL)
+
+def run_ingest(cache, outbox, inbox, requests_queue):
+    """Ingest process: sole owner of upstream polling"""
+    global ROLE, SHARED_CACHE
+    ROLE, SHARED_CACHE = "ingest", cache
+    MARKET_STATE.attach(cache, writer=True)
+    route_bot_through(OutboundClient("ingest", outbox, inbox))
+    
+    threading.Thread(target=serve_on_demand, args=(requests_queue,), daemon=True).start()
+    threading.Thread(target=monitor_markets, daemon=True).start()
+    threading.Thread(target=scheduled_updates, daemon=True).start()
+    ingest_markets()
+
+def run_worker(index, cache, updates, outbox, inbox, requests_queue):
+    """Worker process: handles the updates routed to its shard"""
+    global ROLE, SHARED_CACHE, INGEST_REQUESTS
+    ROLE, SHARED_CACHE, INGEST_REQUESTS = "worker", cache, requests_queue
+    MARKET_STATE.attach(cache, writer=False)
+    route_bot_through(OutboundClient(f"worker-{index}", outbox, inbox))
+    
+    while True:
+        update = updates.get()
+        try:
+            bot.process_new_updates([types.Update.de_json(update)])
+        except Exception as e:
+            print(f"Worker {index} error: {e}")
+
+def _update_chat_id(update):
+    for kind in ('message', 'edited_message', 'channel_post', 'callback_query'):
+        if kind in update:
+            item = update[kind]
+            if kind == 'callback_query':
+                item = item.get('message') or {'chat': item.get('from', {})}
+            return item.get('chat', {}).get('id', 0)
+    return 0
+
+def run_sharded(workers):
+    """Start ingest, workers and sender, then long-poll Telegram in this process"""
+    ctx = multiprocessing.get_context("spawn")
+    manager = CacheManager(ctx=ctx)
+    manager.start()
+    cache = manager.LocalCache()
+    
+    outbox = ctx.Queue()
+    names = ["ingest"] + [f"worker-{i}" for i in range(workers)]
+    replies = {name: ctx.Queue() for name in names}
+    shards = [ctx.Queue() for _ in range(workers)]
+    ingest_requests = ctx.Queue()
+    
+    procs = [
+        ctx.Process(target=run_sender, args=(outbox, replies), name="sender", daemon=True),
+        ctx.Process(target=run_ingest, args=(cache, outbox, replies["ingest"], ingest_requests), name="ingest", daemon=True)
+    ]
+    # Workers run a chart process pool, so they can't be daemonic
+    procs += [ctx.Process(target=run_worker, args=(i, cache, shards[i], outbox, replies[f"worker-{i}"], ingest_requests),
+                          name=f"worker-{i}")
+              for i in range(workers)]
+    for proc in procs:
+        proc.start()
+    
+    print(f"🧩 Sharded mode: 1 ingest, {workers} workers, 1 sender")
+    
+    offset = None
+    try:
+        while True:
+            try:
+                updates = telebot.apihelper.get_updates(TOKEN, offset=offset, timeout=20, long_polling_timeout=20)
+            except Exception as e:
+                print(f"Polling error: {e}")
+                time.sleep(3)
+                continue
+            
+            for update in updates:
+                offset = update['update_id'] + 1
+                # Same chat -> same worker, so each chat's messages stay in order
+                shards[_update_chat_id(update) % workers].put(update)
+    finally:
+        for proc in procs:
+            proc.terminate()
+        manager.shutdown()
+
 # ===========================================
 # MAIN
 # ===========================================
@@ -752,13 +2063,15 @@ if __name__ == "__main__":
     print(f"Alpha Vantage: {'✓' if ALPHA_VANTAGE_KEY else '○ Optional'}")
     print(f"Finnhub: {'✓' if FINNHUB_KEY else '○ Optional'}")
     print(f"FRED: {'✓' if FRED_KEY else '○ Optional'}")
+    print(f"Shards: {SHARDS if SHARDS > 0 else 'single process'}")
     print("="*70 + "\n")
     
     # Set bot commands
     commands = [
         types.BotCommand("start", "Start bot and show main menu"),
         types.BotCommand("menu", "Show interactive menu"),
-        types.BotCommand("help", "Get help and commands")
+        types.BotCommand("help", "Get help and commands"),
+        types.BotCommand("chart", "Price chart, e.g. /chart nifty 50 1w line")
     ]
     bot.set_my_commands(commands)
     
@@ -767,7 +2080,7 @@ if __name__ == "__main__":
     if is_github:
         print("Running scheduled briefing...")
         try:
-            overview = get_complete_overview()
+            overview = get_complete_overview(budget=None)
             bot.send_message(CHAT_ID, f"📊 *SCHEDULED UPDATE*\n\n{overview}", parse_mode="Markdown")
             
             news = get_news(query="finance OR business")
@@ -776,6 +2089,8 @@ if __name__ == "__main__":
             print("✅ Done!")
         except Exception as e:
             print(f"Error: {e}")
+    elif SHARDS > 0:
+        run_sharded(SHARDS)
     else:
         print("🚀 Starting background threads...")
         threading.Thread(target=monitor_markets, daemon=True).start()
@@ -0,0 +1,81 @@
+"""Batch (compute_indicators) and streaming (IndicatorState) paths must agree"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import market_app  # noqa: E402
+
+
+def random_bars(n, volume=True, seed=7):
+    rng = np.random.default_rng(seed)
+    closes = 20000 + np.cumsum(rng.normal(0, 50, n))
+    highs = closes + rng.uniform(0, 40, n)
+    lows = closes - rng.uniform(0, 40, n)
+    opens = closes + rng.normal(0, 10, n)
+    volumes = rng.uniform(1e5, 1e6, n) if volume else np.zeros(n)
+    return np.column_stack([np.arange(n) * 300, opens, highs, lows, closes, volumes]).tolist()
+
+
+def stream(bars):
+    state = market_app.IndicatorState()
+    values = None
+    for bar in bars:
+        values = state.update(bar[4], bar[2], bar[3])
+    return dict(values)
+
+
+def assert_paths_match(bars):
+    batch = market_app.compute_indicators(bars)
+    streaming = stream(bars)
+    
+    for name, value in streaming.items():
+        expected = batch[name]
+        if expected is None:
+            assert value is None, name
+        else:
+            assert value == pytest.approx(expected, rel=1e-9, abs=1e-9), name
+    return batch, streaming
+
+
+# Warm-up edges: RSI/ATR (14), SMA/EMA/Bollinger (20), MACD slow (26),
+# first MACD signal (26 + 9 - 1 = 34) and one past it
+@pytest.mark.parametrize("n", [2, 13, 14, 15, 19, 20, 21, 25, 26, 27, 33, 34, 35])
+def test_warm_up_boundaries(n):
+    batch, streaming = assert_paths_match(random_bars(n))
+    
+    assert (streaming['sma'] is None) == (n < 20)
+    assert (streaming['macd'] is None) == (n < 26)
+    assert (streaming['macd_signal'] is None) == (n < 34)
+
+
+@pytest.mark.parametrize("n", [30, 300, 1000])
+def test_long_series(n):
+    batch, streaming = assert_paths_match(random_bars(n))
+    missing = [name for name, value in streaming.items() if value is None]
+    assert missing == ([] if n >= 34 else ['macd_signal', 'macd_hist'])
+
+
+def test_flat_prices():
+    bars = [[i * 300, 100.0, 100.0, 100.0, 100.0, 1000.0] for i in range(60)]
+    batch, streaming = assert_paths_match(bars)
+    
+    assert batch['rsi'] == streaming['rsi'] == 50.0
+    assert batch['atr'] == pytest.approx(0.0)
+    assert batch['bb_upper'] == pytest.approx(batch['bb_lower'])
+    assert market_app.describe_signals(batch) == ['RSI 50', 'above SMA20']
+
+
+def test_zero_volume():
+    batch, _ = assert_paths_match(random_bars(100, volume=False))
+    assert batch['vwap'] is None
+
+
+def test_vwap_matches_definition():
+    bars = np.asarray(random_bars(50))
+    typical = (bars[:, 2] + bars[:, 3] + bars[:, 4]) / 3
+    expected = (typical * bars[:, 5]).sum() / bars[:, 5].sum()
+    assert market_app.compute_indicators(bars.tolist())['vwap'] == pytest.approx(expected)